@@ -1,11 +1,31 @@
+import bisect
+import io
 import json
 import os
-from typing import Dict, List, Any, Tuple
+import re
+import stat
+import sys
+import uuid
+from typing import Callable, Dict, FrozenSet, Iterable, Iterator, List, Any, Optional, Tuple
 from datetime import date
+from itertools import chain, islice
+
+try:
+    from itertools import batched
+except ImportError:  # Python 3.10/3.11 (3.10+ is required for bisect's key=)
+    def batched(iterable: Iterable[str], n: int) -> Iterator[Tuple[str, ...]]:
+        it = iter(iterable)
+        while chunk := tuple(islice(it, n)):
+            yield chunk
 
 import streamlit as st
 import streamlit.components.v1 as components
 
+try:
+    import orjson  # optional: faster JSON load/save
+except ImportError:
+    orjson = None
+
 # =========================================================
 # Shopping List App (Streamlit)
 # - Store tiles with category-grouped items
@@ -42,22 +62,30 @@ DEFAULT_STORES: Dict[str, Dict[str, List[str]]] = {
     },
 }
 
+# selected[(store, category)] = frozenset(items); replaced, never mutated
+Selection = Dict[Tuple[str, str], FrozenSet[str]]
+EMPTY_SELECTION: FrozenSet[str] = frozenset()
+# lower_index[store][category] = [(item, item.lower()), ...]
+LowerIndex = Dict[str, Dict[str, List[Tuple[str, str]]]]
+
 DEFAULT_STORE_ORDER = ["Costco", "Walmart", "Indian Store", "Marianos"]
 
 CHECKBOX_BULLET = "☐"   # Looks good in WhatsApp
 UNDERLINE_CHAR = "—"    # Use a simple underline line; WhatsApp doesn't support true underline
 
+_WS_RE = re.compile(r"\s+")
+
 
 # -----------------------------
 # Basic helpers
 # -----------------------------
 def normalize_name(name: str) -> str:
-    return " ".join(str(name).strip().split())
+    return _WS_RE.sub(" ", str(name)).strip()
 
 
 def _sorted_unique(items: List[str]) -> List[str]:
     clean = [normalize_name(x) for x in items if normalize_name(x)]
-    return sorted(list(set(clean)), key=lambda s: s.lower())
+    return sorted(list(set(clean)), key=str.lower)
 
 
 # -----------------------------
@@ -98,77 +126,180 @@ def convert_legacy_shape(data: Dict[str, Any]) -> Dict[str, Dict[str, List[str]]
     return converted
 
 
+def _json_loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+
+
+def _file_mtime(path: str) -> float:
+    return os.path.getmtime(path) if os.path.exists(path) else 0.0
+
+
+@st.cache_data(show_spinner=False)
+def _load_stores_cached(path: str, mtime: float) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Read and clean the stores file. `mtime` is only part of the cache key,
+    so editing the file on disk invalidates the cached copy.
+    """
+    try:
+        with open(path, "rb") as f:
+            raw = _json_loads(f.read())
+        if isinstance(raw, dict):
+            cleaned = convert_legacy_shape(raw)
+            return cleaned if cleaned else default_stores()
+    except Exception:
+        return default_stores()
+    return default_stores()
+
+
+def default_stores() -> Dict[str, Dict[str, List[str]]]:
+    """
+    Fresh, sorted copy of DEFAULT_STORES. Items are mutated in place, so the
+    module-level defaults must never be shared with session state.
+    """
+    return intern_stores(convert_legacy_shape(DEFAULT_STORES))
+
+
+def intern_stores(stores: Dict[str, Dict[str, List[str]]]) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Intern store, category and item names so duplicates across stores share
+    one object and set/dict lookups hit the identity fast path. Applied after
+    the cached load, since st.cache_data hands back unpickled (non-interned) copies.
+    """
+    return {
+        sys.intern(store): {sys.intern(cat): [sys.intern(it) for it in items] for cat, items in cat_map.items()}
+        for store, cat_map in stores.items()
+    }
+
+
 def load_stores() -> Dict[str, Dict[str, List[str]]]:
     if os.path.exists(DATA_FILE):
+        return intern_stores(_load_stores_cached(DATA_FILE, _file_mtime(DATA_FILE)))
+    return default_stores()
+
+
+def _write_json_if_changed(path: str, data: Any) -> bool:
+    """
+    Write `data` as JSON via a unique temp file + os.replace, so a crash or a
+    concurrent session never leaves a torn file. Skips the write when this
+    session last wrote the same content and the file has not been touched since.
+    """
+    payload = _json_dumps(data)
+    saved: Dict[str, Tuple[bytes, float]] = st.session_state.setdefault("_saved_payloads", {})
+    if saved.get(path) == (payload, _file_mtime(path)):
+        return False
+
+    # Unique name per write; O_EXCL + 0o666 lets the umask set the mode of a
+    # new file just like open(path, "w"), and an existing file keeps its mode.
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if os.path.exists(path):
+                os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode))
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
         try:
-            with open(DATA_FILE, "r", encoding="utf-8") as f:
-                raw = json.load(f)
-            if isinstance(raw, dict):
-                cleaned = convert_legacy_shape(raw)
-                return cleaned if cleaned else DEFAULT_STORES.copy()
-        except Exception:
-            return DEFAULT_STORES.copy()
-    return DEFAULT_STORES.copy()
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    saved[path] = (payload, _file_mtime(path))
+    return True
 
 
 def save_stores(stores: Dict[str, Dict[str, List[str]]]) -> None:
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(stores, f, indent=2, ensure_ascii=False)
+    _write_json_if_changed(DATA_FILE, stores)
 
 
-def load_store_order(stores: Dict[str, Dict[str, List[str]]]) -> List[str]:
+@st.cache_data(show_spinner=False)
+def _load_saved_order_cached(path: str, mtime: float) -> List[str]:
+    """
+    Read the saved store order from the meta file (cached per file mtime).
+    """
+    try:
+        with open(path, "rb") as f:
+            meta = _json_loads(f.read())
+        if isinstance(meta, dict) and isinstance(meta.get("store_order"), list):
+            return [normalize_name(x) for x in meta["store_order"] if normalize_name(x)]
+    except Exception:
+        return []
+    return []
+
+
+def load_store_order(stores: Dict[str, Dict[str, List[str]]], sorted_names: Optional[List[str]] = None) -> List[str]:
     """
     Load user-defined store visit order.
     If missing, use DEFAULT_STORE_ORDER plus any additional stores appended.
+    Pass `sorted_names` (stores sorted case-insensitively) to skip re-sorting.
     """
     order: List[str] = []
     if os.path.exists(META_FILE):
-        try:
-            with open(META_FILE, "r", encoding="utf-8") as f:
-                meta = json.load(f)
-            if isinstance(meta, dict) and isinstance(meta.get("store_order"), list):
-                order = [normalize_name(x) for x in meta["store_order"] if normalize_name(x)]
-        except Exception:
-            order = []
+        order = _load_saved_order_cached(META_FILE, _file_mtime(META_FILE))
 
     # Seed order if empty
     if not order:
         order = DEFAULT_STORE_ORDER.copy()
 
-    # Remove stores that no longer exist
-    order = [s for s in order if s in stores]
+    # Remove stores that no longer exist and duplicates, keeping the first
+    # occurrence; the shopping list relies on every store appearing exactly once
+    seen = set()
+    out: List[str] = []
+    for s in order:
+        if s in stores and s not in seen:
+            out.append(s)
+            seen.add(s)
 
     # Append any stores not already in order
-    for s in sorted(stores.keys(), key=lambda x: x.lower()):
-        if s not in order:
-            order.append(s)
+    if sorted_names is None:
+        sorted_names = sorted(stores.keys(), key=str.lower)
+    for s in sorted_names:
+        if s not in seen:
+            out.append(s)
+            seen.add(s)
 
-    return order
+    return out
 
 
 def save_store_order(order: List[str]) -> None:
-    with open(META_FILE, "w", encoding="utf-8") as f:
-        json.dump({"store_order": order}, f, indent=2, ensure_ascii=False)
+    _write_json_if_changed(META_FILE, {"store_order": order})
 
 
-def add_store(stores: Dict[str, Dict[str, List[str]]], store_name: str) -> Dict[str, Dict[str, List[str]]]:
-    store_name = normalize_name(store_name)
+# -----------------------------
+# Mutations
+# Remove helpers also drop the matching `selected` entries, so the selection
+# never needs a full re-alignment pass on rerun. Missing keys mean "nothing
+# selected", so add helpers leave the selection alone.
+# -----------------------------
+def add_store(stores: Dict[str, Dict[str, List[str]]], store_order: List[str], store_name: str) -> Dict[str, Dict[str, List[str]]]:
+    store_name = sys.intern(normalize_name(store_name))
     if store_name and store_name not in stores:
         stores[store_name] = {"Uncategorized": []}
+        store_order.append(store_name)
     return stores
 
 
 def add_category(stores: Dict[str, Dict[str, List[str]]], store_name: str, category_name: str) -> Dict[str, Dict[str, List[str]]]:
-    store_name = normalize_name(store_name)
-    category_name = normalize_name(category_name) or "Uncategorized"
+    store_name = sys.intern(normalize_name(store_name))
+    category_name = sys.intern(normalize_name(category_name) or "Uncategorized")
     if store_name in stores and category_name not in stores[store_name]:
         stores[store_name][category_name] = []
     return stores
 
 
 def add_items(stores: Dict[str, Dict[str, List[str]]], store_name: str, category_name: str, items_text: str) -> Dict[str, Dict[str, List[str]]]:
-    store_name = normalize_name(store_name)
-    category_name = normalize_name(category_name) or "Uncategorized"
+    store_name = sys.intern(normalize_name(store_name))
+    category_name = sys.intern(normalize_name(category_name) or "Uncategorized")
     if store_name not in stores:
         return stores
     if category_name not in stores[store_name]:
@@ -176,34 +307,48 @@ def add_items(stores: Dict[str, Dict[str, List[str]]], store_name: str, category
 
     raw = items_text.replace("\n", ",")
     new_items = [normalize_name(x) for x in raw.split(",")]
-    new_items = [x for x in new_items if x]
+    new_items = [sys.intern(x) for x in new_items if x]
 
-    merged = set(stores[store_name][category_name])
+    # Category lists are kept sorted, so insert rather than re-sort
+    items = stores[store_name][category_name]
+    existing = set(items)
     for item in new_items:
-        merged.add(item)
+        if item not in existing:
+            bisect.insort(items, item, key=str.lower)
+            existing.add(item)
 
-    stores[store_name][category_name] = sorted(merged, key=lambda s: s.lower())
     return stores
 
 
-def remove_item(stores: Dict[str, Dict[str, List[str]]], store_name: str, category_name: str, item: str) -> Dict[str, Dict[str, List[str]]]:
+def remove_item(stores: Dict[str, Dict[str, List[str]]], selected: Selection, store_name: str, category_name: str, item: str) -> Dict[str, Dict[str, List[str]]]:
     if store_name in stores and category_name in stores[store_name]:
-        stores[store_name][category_name] = [x for x in stores[store_name][category_name] if x != item]
+        try:
+            stores[store_name][category_name].remove(item)
+        except ValueError:
+            pass
+        key = (store_name, category_name)
+        if item in selected.get(key, EMPTY_SELECTION):
+            selected[key] = selected[key] - {item}
     return stores
 
 
-def remove_category(stores: Dict[str, Dict[str, List[str]]], store_name: str, category_name: str) -> Dict[str, Dict[str, List[str]]]:
+def remove_category(stores: Dict[str, Dict[str, List[str]]], selected: Selection, store_name: str, category_name: str) -> Dict[str, Dict[str, List[str]]]:
     if store_name in stores and category_name in stores[store_name]:
         if len(stores[store_name]) > 1:
             del stores[store_name][category_name]
         else:
             stores[store_name] = {"Uncategorized": []}
+        selected.pop((store_name, category_name), None)
     return stores
 
 
-def remove_store(stores: Dict[str, Dict[str, List[str]]], store_name: str) -> Dict[str, Dict[str, List[str]]]:
+def remove_store(stores: Dict[str, Dict[str, List[str]]], selected: Selection, store_order: List[str], store_name: str) -> Dict[str, Dict[str, List[str]]]:
     if store_name in stores:
         del stores[store_name]
+        for key in [k for k in selected if k[0] == store_name]:
+            del selected[key]
+        if store_name in store_order:
+            store_order.remove(store_name)
     return stores
 
 
@@ -223,32 +368,43 @@ def store_color(store: str) -> str:
     return "#2B2B2B"
 
 
-def chunk_list(items: List[str], n: int) -> List[List[str]]:
-    return [items[i:i + n] for i in range(0, len(items), n)]
+def tile_chrome_html(store: str, color: str) -> str:
+    """
+    Static header HTML for a store tile, emitted in a single st.markdown call.
+    """
+    return (
+        "<div class='tile'>"
+        f"<div class='tile-title' style='color:{color};'>{store}</div>"
+        "<div class='subtle'>Pick items by category</div>"
+        "<div class='divider'></div>"
+        "</div>"
+    )
 
 
-def ordered_stores(store_order: List[str], stores: Dict[str, Any]) -> List[str]:
+def build_lower_index(stores: Dict[str, Dict[str, List[str]]]) -> LowerIndex:
     """
-    Return stores in visit order first, then anything else alphabetically.
+    Pair every item with its lowercase form so search filtering does not
+    re-lowercase each item on every rerun.
     """
-    seen = set()
-    out: List[str] = []
-
-    for s in store_order:
-        if s in stores and s not in seen:
-            out.append(s)
-            seen.add(s)
+    return {
+        store: {cat: [(it, it.lower()) for it in items] for cat, items in cat_map.items()}
+        for store, cat_map in stores.items()
+    }
 
-    for s in sorted(stores.keys(), key=lambda x: x.lower()):
-        if s not in seen:
-            out.append(s)
-            seen.add(s)
 
+def selection_by_store(selected: Selection) -> Dict[str, Dict[str, FrozenSet[str]]]:
+    """
+    Regroup the flat selection as {store: {category: items}}, skipping empties.
+    """
+    out: Dict[str, Dict[str, FrozenSet[str]]] = {}
+    for (store, cat), items in selected.items():
+        if items:
+            out.setdefault(store, {})[cat] = items
     return out
 
 
 def format_shopping_list_for_whatsapp(
-    selected: Dict[str, Dict[str, List[str]]],
+    selected: Dict[str, Dict[str, Iterable[str]]],
     store_order: List[str],
 ) -> str:
     """
@@ -257,47 +413,41 @@ def format_shopping_list_for_whatsapp(
     - Store header is bold (*Store*)
     - Underline is simulated with a line of characters
     - Items are a single checklist (no category headings)
+    Stores are printed in `store_order`, which must list every store once;
+    a store in `selected` that is missing from `store_order` is left out.
     """
     today = date.today().strftime("%b %d, %Y")  # Example: Feb 21, 2026
-    lines: List[str] = [f"Shopping List - {today}", ""]
+    buf = io.StringIO()
+    buf.write(f"Shopping List - {today}\n\n")
 
-    stores_in_order = ordered_stores(store_order, selected)
-
-    for store in stores_in_order:
+    for store in store_order:
         cat_map = selected.get(store, {})
 
-        # Flatten items across categories
-        all_items: List[str] = []
-        for cat in cat_map:
-            all_items.extend(cat_map[cat])
-
-        # Remove empties and duplicates, sort
-        all_items = [normalize_name(x) for x in all_items if normalize_name(x)]
-        all_items = sorted(list(set(all_items)), key=lambda s: s.lower())
+        # Flatten items across categories, dedupe and sort.
+        # Items are already normalized when they are added.
+        all_items = sorted({*chain.from_iterable(cat_map.values())}, key=str.lower)
 
         if not all_items:
             continue
 
-        header = f"*{store}*"
-        underline = UNDERLINE_CHAR * max(6, min(22, len(store) + 2))
-
-        lines.append(header)
-        lines.append(underline)
+        buf.write(f"*{store}*\n")
+        buf.write(UNDERLINE_CHAR * max(6, min(22, len(store) + 2)))
+        buf.write("\n")
 
         for it in all_items:
-            lines.append(f"{CHECKBOX_BULLET} {it}")
+            buf.write(CHECKBOX_BULLET)
+            buf.write(" ")
+            buf.write(it)
+            buf.write("\n")
 
-        lines.append("")  # blank line between stores
+        buf.write("\n")  # blank line between stores
 
-    return "\n".join(lines).strip()
+    return buf.getvalue().rstrip()
 
 
 def copy_button(text_to_copy: str, label: str = "Copy list") -> None:
-    safe_text = (
-        text_to_copy.replace("\\", "\\\\")
-        .replace("`", "\\`")
-        .replace("${", "\\${")
-    )
+    # JSON string literal is valid JS; escape "</" so the text can't close the <script>
+    safe_text = json.dumps(text_to_copy).replace("</", "<\\/")
     components.html(
         f"""
         <div style="display:flex; gap:10px; align-items:center; margin: 6px 0 14px 0;">
@@ -312,7 +462,7 @@ def copy_button(text_to_copy: str, label: str = "Copy list") -> None:
         <script>
           const btn = document.getElementById("copyBtn");
           const status = document.getElementById("copyStatus");
-          const text = `{safe_text}`;
+          const text = {safe_text};
 
           btn.addEventListener("click", async () => {{
             try {{
@@ -329,7 +479,7 @@ def copy_button(text_to_copy: str, label: str = "Copy list") -> None:
     )
 
 
-def parse_store_order_text(text: str, stores: Dict[str, Any]) -> List[str]:
+def parse_store_order_text(text: str, stores: Dict[str, Any], sorted_names: Optional[List[str]] = None) -> List[str]:
     """
     Parse one store per line, keep only valid stores, append missing ones.
     """
@@ -345,7 +495,9 @@ def parse_store_order_text(text: str, stores: Dict[str, Any]) -> List[str]:
             seen.add(s)
 
     # Append any stores not listed
-    for s in sorted(stores.keys(), key=lambda x: x.lower()):
+    if sorted_names is None:
+        sorted_names = sorted(stores.keys(), key=str.lower)
+    for s in sorted_names:
         if s not in seen:
             out.append(s)
             seen.add(s)
@@ -353,38 +505,117 @@ def parse_store_order_text(text: str, stores: Dict[str, Any]) -> List[str]:
     return out
 
 
+def derived_from_stores(
+    name: str,
+    stores: Dict[str, Dict[str, List[str]]],
+    build: Callable[[Dict[str, Dict[str, List[str]]]], Any],
+) -> Any:
+    """
+    Return build(stores), cached in session state until stores_version changes.
+    """
+    cached = st.session_state.get(name)
+    if cached is None or cached[0] != st.session_state.stores_version:
+        cached = (st.session_state.stores_version, build(stores))
+        st.session_state[name] = cached
+    return cached[1]
+
+
 # -----------------------------
 # App
 # -----------------------------
 st.set_page_config(page_title="Shopping List App", page_icon="🛒", layout="wide")
 
+
+def bump_stores_version() -> None:
+    """
+    Mark `stores` as changed so anything derived from it is rebuilt.
+    """
+    st.session_state.stores_version = st.session_state.get("stores_version", 0) + 1
+
+
+def mark_dirty() -> None:
+    """
+    Flag stores + store order as changed since the last save.
+    """
+    st.session_state.stores_dirty = True
+
+
+def _mutate(fn: Callable[..., Dict[str, Dict[str, List[str]]]], *args: Any) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Apply a mutation helper to the session stores and mark them dirty.
+    Writes stay synchronous: every handler calls save_and_rerun() right
+    after, so each action is written to disk before the rerun.
+    """
+    st.session_state.stores = fn(st.session_state.stores, *args)
+    bump_stores_version()
+    mark_dirty()
+    return st.session_state.stores
+
+
+def flush_saves() -> None:
+    """
+    Write stores + store order if anything changed since the last save.
+    """
+    if st.session_state.get("stores_dirty", False):
+        save_stores(st.session_state.stores)
+        save_store_order(st.session_state.store_order)
+        st.session_state.stores_dirty = False
+
+
+def save_and_rerun() -> None:
+    """
+    Persist pending changes, then rerun. st.rerun() stops the current run,
+    so the write has to happen before it rather than at the end of the script.
+    """
+    flush_saves()
+    st.rerun()
+
+
+def toggle_selected(key: str, store: str, cat: str, item: str) -> None:
+    """
+    Checkbox on_change callback: update the selection once per actual click.
+    """
+    sel: Selection = st.session_state.selected
+    current = sel.get((store, cat), EMPTY_SELECTION)
+    if st.session_state[key]:
+        sel[(store, cat)] = current | {item}
+    else:
+        sel[(store, cat)] = current - {item}
+
+
+def clear_selection() -> None:
+    """
+    Empty the selection together with the checkbox widget state. Widget state
+    is the input for toggle_selected, so leaving chk:: keys behind would keep
+    boxes ticked that the list no longer contains.
+    """
+    st.session_state.selected = {}
+    for k in [k for k in st.session_state if str(k).startswith("chk::")]:
+        del st.session_state[k]
+
+
 if "stores" not in st.session_state:
     st.session_state.stores = load_stores()
+    bump_stores_version()
 
 stores: Dict[str, Dict[str, List[str]]] = st.session_state.stores
 
+# Sorted once per rerun and shared by tiles, selectboxes and store-order helpers
+sorted_store_names: List[str] = sorted(stores.keys(), key=str.lower)
+
+# Derived data, rebuilt only when stores change
+lower_index: LowerIndex = derived_from_stores("lower_index", stores, build_lower_index)
+store_colors: Dict[str, str] = derived_from_stores("store_colors", stores, lambda d: {s: store_color(s) for s in d})
+tile_chrome: Dict[str, str] = derived_from_stores("tile_chrome", stores, lambda d: {s: tile_chrome_html(s, store_colors[s]) for s in d})
+
 if "store_order" not in st.session_state:
-    st.session_state.store_order = load_store_order(stores)
+    st.session_state.store_order = load_store_order(stores, sorted_store_names)
 
 # Selection state:
-# selected[store][category] = set(items)
+# selected[(store, category)] = frozenset(items)
+# Kept in sync by the mutation helpers and the checkbox callback.
 if "selected" not in st.session_state:
-    st.session_state.selected = {s: {c: set() for c in stores[s].keys()} for s in stores}
-
-# Keep selection aligned with stores/categories
-for store in list(st.session_state.selected.keys()):
-    if store not in stores:
-        del st.session_state.selected[store]
-for store in stores:
-    st.session_state.selected.setdefault(store, {})
-    for cat in stores[store]:
-        st.session_state.selected[store].setdefault(cat, set())
-    for cat in list(st.session_state.selected[store].keys()):
-        if cat not in stores[store]:
-            del st.session_state.selected[store][cat]
-
-# Keep store order aligned
-st.session_state.store_order = load_store_order(stores)
+    st.session_state.selected = {}
 
 # Styling
 st.markdown(
@@ -437,24 +668,22 @@ with right_head:
     c1, c2, c3 = st.columns(3)
     with c1:
         if st.button("Clear selections", use_container_width=True):
-            for s in st.session_state.selected:
-                for c in st.session_state.selected[s]:
-                    st.session_state.selected[s][c] = set()
+            clear_selection()
             st.rerun()
     with c2:
         if st.button("Save stores/items", use_container_width=True):
-            save_stores(stores)
-            save_store_order(st.session_state.store_order)
+            mark_dirty()
+            flush_saves()
             st.success("Saved!")
     with c3:
         if st.button("Reset to defaults", use_container_width=True):
-            st.session_state.stores = DEFAULT_STORES.copy()
+            st.session_state.stores = default_stores()
+            bump_stores_version()
             stores = st.session_state.stores
-            st.session_state.selected = {s: {c: set() for c in stores[s].keys()} for s in stores}
+            clear_selection()
             st.session_state.store_order = load_store_order(stores)
-            save_stores(stores)
-            save_store_order(st.session_state.store_order)
-            st.rerun()
+            mark_dirty()
+            save_and_rerun()
 
 st.write("")
 
@@ -468,15 +697,22 @@ main_col, list_col = st.columns([3.2, 1.6], gap="large")
 with list_col:
     st.subheader("Your Shopping List")
 
-    # Build output structure from selection
-    selected_for_output: Dict[str, Dict[str, List[str]]] = {}
-    for store in stores:
-        selected_for_output[store] = {}
-        for cat in stores[store]:
-            items = sorted(list(st.session_state.selected[store].get(cat, set())), key=lambda s: s.lower())
-            selected_for_output[store][cat] = items
-
-    list_text = format_shopping_list_for_whatsapp(selected_for_output, st.session_state.store_order)
+    # Rebuild the text only when the selection, store order or date changed.
+    # The key holds the frozensets themselves: unchanged entries are the same
+    # objects, so comparing keys is an identity check per entry.
+    list_key = (
+        tuple(st.session_state.selected.items()),
+        tuple(st.session_state.store_order),
+        date.today(),
+    )
+    cached_list = st.session_state.get("list_text_cache")
+    if cached_list is not None and cached_list[0] == list_key:
+        list_text = cached_list[1]
+    else:
+        list_text = format_shopping_list_for_whatsapp(
+            selection_by_store(st.session_state.selected), st.session_state.store_order
+        )
+        st.session_state.list_text_cache = (list_key, list_text)
 
     if list_text.strip():
         copy_button(list_text, label="Copy list")
@@ -499,147 +735,131 @@ with list_col:
     )
 
     if st.button("Update store order"):
-        new_order = parse_store_order_text(order_text, stores)
+        new_order = parse_store_order_text(order_text, stores, sorted_store_names)
         st.session_state.store_order = new_order
-        save_store_order(new_order)
+        mark_dirty()
         st.success("Store visit order updated.")
-        st.rerun()
+        save_and_rerun()
 
     st.markdown("---")
     st.subheader("Add / Edit")
-
-    with st.expander("Add a new store", expanded=False):
-        new_store = st.text_input("Store name", placeholder="Example: Target")
-        if st.button("Add store"):
-            new_store = normalize_name(new_store)
-            if not new_store:
-                st.warning("Enter a store name.")
-            elif new_store in stores:
-                st.warning("That store already exists.")
-            else:
-                stores = add_store(stores, new_store)
-                st.session_state.stores = stores
-                st.session_state.selected.setdefault(new_store, {"Uncategorized": set()})
-                st.session_state.store_order = load_store_order(stores)
-                save_stores(stores)
-                save_store_order(st.session_state.store_order)
-                st.success(f"Added: {new_store}")
-                st.rerun()
-
-    with st.expander("Add a category to a store", expanded=False):
-        store_for_cat = st.selectbox("Choose store", options=sorted(stores.keys(), key=lambda s: s.lower()), key="add_cat_store")
-        new_cat = st.text_input("Category name", placeholder="Example: Household, Produce, Dairy")
-        if st.button("Add category"):
-            new_cat = normalize_name(new_cat) or "Uncategorized"
-            stores = add_category(stores, store_for_cat, new_cat)
-            st.session_state.stores = stores
-            st.session_state.selected[store_for_cat].setdefault(new_cat, set())
-            save_stores(stores)
-            st.success(f"Added category: {new_cat}")
-            st.rerun()
-
-    with st.expander("Add products to a store category", expanded=False):
-        store_for_items = st.selectbox("Choose store", options=sorted(stores.keys(), key=lambda s: s.lower()), key="add_items_store")
-        existing_cats = sorted(stores[store_for_items].keys(), key=lambda s: s.lower())
-        cat_pick = st.selectbox("Choose category", options=existing_cats + ["+ Create new category"], key="add_items_cat")
-
-        if cat_pick == "+ Create new category":
-            cat_name = st.text_input("New category name", placeholder="Example: Pantry")
-        else:
-            cat_name = cat_pick
-
-        items_text = st.text_area(
-            "Products (comma or new line separated)",
-            placeholder="Example:\nYogurt\nCereal\nOr: Yogurt, Cereal",
-            height=120,
-        )
-
-        if st.button("Add products"):
-            cat_name = normalize_name(cat_name) or "Uncategorized"
-            if not items_text.strip():
-                st.warning("Enter at least one product.")
+    # Toggles instead of expanders: a collapsed expander still runs its body
+    # and emits every widget inside it, a switched-off toggle skips it.
+
+    if st.toggle("Add a new store", key="show_add_store"):
+        with st.container(border=True):
+            new_store = st.text_input("Store name", placeholder="Example: Target")
+            if st.button("Add store"):
+                new_store = normalize_name(new_store)
+                if not new_store:
+                    st.warning("Enter a store name.")
+                elif new_store in stores:
+                    st.warning("That store already exists.")
+                else:
+                    stores = _mutate(add_store, st.session_state.store_order, new_store)
+                    st.success(f"Added: {new_store}")
+                    save_and_rerun()
+
+    if st.toggle("Add a category to a store", key="show_add_cat"):
+        with st.container(border=True):
+            store_for_cat = st.selectbox("Choose store", options=sorted_store_names, key="add_cat_store")
+            new_cat = st.text_input("Category name", placeholder="Example: Household, Produce, Dairy")
+            if st.button("Add category"):
+                new_cat = normalize_name(new_cat) or "Uncategorized"
+                stores = _mutate(add_category, store_for_cat, new_cat)
+                st.success(f"Added category: {new_cat}")
+                save_and_rerun()
+
+    if st.toggle("Add products to a store category", key="show_add_items"):
+        with st.container(border=True):
+            store_for_items = st.selectbox("Choose store", options=sorted_store_names, key="add_items_store")
+            existing_cats = sorted(stores[store_for_items].keys(), key=str.lower)
+            cat_pick = st.selectbox("Choose category", options=existing_cats + ["+ Create new category"], key="add_items_cat")
+
+            if cat_pick == "+ Create new category":
+                cat_name = st.text_input("New category name", placeholder="Example: Pantry")
             else:
-                stores = add_items(stores, store_for_items, cat_name, items_text)
-                st.session_state.stores = stores
-                st.session_state.selected[store_for_items].setdefault(cat_name, set())
-                save_stores(stores)
-                st.success("Products added.")
-                st.rerun()
-
-    with st.expander("Remove a product, category, or store", expanded=False):
-        store_rm = st.selectbox("Store", options=["(choose)"] + sorted(stores.keys(), key=lambda s: s.lower()), key="rm_store")
-        if store_rm != "(choose)":
-            cats_rm = sorted(stores[store_rm].keys(), key=lambda s: s.lower())
-            cat_rm = st.selectbox("Category", options=["(choose)"] + cats_rm, key="rm_cat")
-
-            if cat_rm != "(choose)":
-                items_rm = stores[store_rm][cat_rm]
-                if items_rm:
-                    item_rm = st.selectbox("Product", options=["(choose)"] + items_rm, key="rm_item")
-                    if item_rm != "(choose)":
-                        if st.button("Remove product"):
-                            stores = remove_item(stores, store_rm, cat_rm, item_rm)
-                            st.session_state.stores = stores
-                            st.session_state.selected[store_rm][cat_rm].discard(item_rm)
-                            save_stores(stores)
-                            st.success(f"Removed: {item_rm}")
-                            st.rerun()
+                cat_name = cat_pick
+
+            items_text = st.text_area(
+                "Products (comma or new line separated)",
+                placeholder="Example:\nYogurt\nCereal\nOr: Yogurt, Cereal",
+                height=120,
+            )
+
+            if st.button("Add products"):
+                cat_name = normalize_name(cat_name) or "Uncategorized"
+                if not items_text.strip():
+                    st.warning("Enter at least one product.")
                 else:
-                    st.caption("No products in this category.")
+                    stores = _mutate(add_items, store_for_items, cat_name, items_text)
+                    st.success("Products added.")
+                    save_and_rerun()
+
+    if st.toggle("Remove a product, category, or store", key="show_remove"):
+        with st.container(border=True):
+            store_rm = st.selectbox("Store", options=["(choose)"] + sorted_store_names, key="rm_store")
+            if store_rm != "(choose)":
+                cats_rm = sorted(stores[store_rm].keys(), key=str.lower)
+                cat_rm = st.selectbox("Category", options=["(choose)"] + cats_rm, key="rm_cat")
+
+                if cat_rm != "(choose)":
+                    items_rm = stores[store_rm][cat_rm]
+                    if items_rm:
+                        item_rm = st.selectbox("Product", options=["(choose)"] + items_rm, key="rm_item")
+                        if item_rm != "(choose)":
+                            if st.button("Remove product"):
+                                stores = _mutate(remove_item, st.session_state.selected, store_rm, cat_rm, item_rm)
+                                st.success(f"Removed: {item_rm}")
+                                save_and_rerun()
+                    else:
+                        st.caption("No products in this category.")
+
+                    st.write("")
+                    if st.button("Remove category"):
+                        stores = _mutate(remove_category, st.session_state.selected, store_rm, cat_rm)
+                        st.success(f"Removed category: {cat_rm}")
+                        save_and_rerun()
 
                 st.write("")
-                if st.button("Remove category"):
-                    stores = remove_category(stores, store_rm, cat_rm)
-                    st.session_state.stores = stores
-                    if cat_rm in st.session_state.selected[store_rm]:
-                        del st.session_state.selected[store_rm][cat_rm]
-                    save_stores(stores)
-                    st.success(f"Removed category: {cat_rm}")
-                    st.rerun()
-
-            st.write("")
-            if st.button("Remove store"):
-                stores = remove_store(stores, store_rm)
-                st.session_state.stores = stores
-                if store_rm in st.session_state.selected:
-                    del st.session_state.selected[store_rm]
-                st.session_state.store_order = load_store_order(stores)
-                save_stores(stores)
-                save_store_order(st.session_state.store_order)
-                st.success(f"Removed store: {store_rm}")
-                st.rerun()
+                if st.button("Remove store"):
+                    stores = _mutate(remove_store, st.session_state.selected, st.session_state.store_order, store_rm)
+                    st.success(f"Removed store: {store_rm}")
+                    save_and_rerun()
 
 # Left panel: store tiles
 with main_col:
     # Keep tile order alphabetical (nice scanning), list order is visit-order
-    store_names = sorted(stores.keys(), key=lambda s: s.lower())
-    rows = chunk_list(store_names, 2)
+    # visible[store][category] = items to show; while searching, built in one
+    # pass over the lowercase index and holding only stores/categories with matches
+    visible: Dict[str, Dict[str, List[str]]] = stores
+    tile_stores = sorted_store_names
+    if search_norm:
+        visible = {}
+        for s in sorted_store_names:
+            matches = {}
+            for cat, pairs in lower_index.get(s, {}).items():
+                hits = [it for it, itl in pairs if search_norm in itl]
+                if hits:
+                    matches[cat] = hits
+            if matches:
+                visible[s] = matches
+        tile_stores = list(visible)
+        if not tile_stores:
+            st.caption("No matches in any store.")
+    rows = batched(tile_stores, 2)
 
     for row in rows:
         cols = st.columns(2, gap="large")
         for i, store in enumerate(row):
             with cols[i]:
-                color = store_color(store)
-                st.markdown("<div class='tile'>", unsafe_allow_html=True)
-                st.markdown(
-                    f"<div class='tile-title' style='color:{color};'>{store}</div>"
-                    f"<div class='subtle'>Pick items by category</div>"
-                    f"<div class='divider'></div>",
-                    unsafe_allow_html=True,
-                )
-
-                cat_map = stores.get(store, {})
-                any_visible = False
-
-                for cat in sorted(cat_map.keys(), key=lambda s: s.lower()):
-                    items = cat_map[cat]
+                st.markdown(tile_chrome[store], unsafe_allow_html=True)
 
-                    # Filter by search
-                    if search_norm:
-                        visible_items = [it for it in items if search_norm in it.lower()]
-                    else:
-                        visible_items = items
+                cat_map = visible.get(store, {})
+                any_visible = False
 
+                for cat in sorted(cat_map.keys(), key=str.lower):
+                    visible_items = cat_map[cat]
                     if not visible_items:
                         continue
 
@@ -648,20 +868,16 @@ with main_col:
 
                     for item in visible_items:
                         key = f"chk::{store}::{cat}::{item}"
-                        default_checked = item in st.session_state.selected[store][cat]
-                        checked = st.checkbox(item, value=default_checked, key=key)
-
-                        if checked:
-                            st.session_state.selected[store][cat].add(item)
-                        else:
-                            st.session_state.selected[store][cat].discard(item)
+                        default_checked = item in st.session_state.selected.get((store, cat), EMPTY_SELECTION)
+                        st.checkbox(
+                            item,
+                            value=default_checked,
+                            key=key,
+                            on_change=toggle_selected,
+                            args=(key, store, cat, item),
+                        )
 
                 if not any_visible:
-                    if search_norm:
-                        st.caption("No matches in this store.")
-                    else:
-                        st.caption("No products yet. Add some from the right panel.")
-
-                st.markdown("</div>", unsafe_allow_html=True)
+                    st.caption("No products yet. Add some from the right panel.")
 
 st.caption("Tip: Select items, then Copy list and paste into WhatsApp. Use the store order box to match your shopping route.")
\ No newline at end of file